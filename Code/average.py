@@ -2,6 +2,14 @@
 import yfinance as yf
 import pandas as pd
 
+def moving_averages(close, window_sizes=[20, 50, 200]):
+    """Return the latest moving average of a closing price series for each window size."""
+    averages = {}
+    for window in window_sizes:
+        ma = close.rolling(window=window).mean()
+        averages[f'{window}-day MA'] = ma.iloc[-1]  # Get the latest moving average
+    return averages
+
 class StockAveragesFetcher:
     def __init__(self, ticker):
         self.ticker = ticker
@@ -10,11 +18,7 @@ class StockAveragesFetcher:
 
     def get_moving_averages(self, window_sizes=[20, 50, 200]):
         """Calculate and return moving averages for specified window sizes."""
-        moving_averages = {}
-        for window in window_sizes:
-            ma = self.data['Close'].rolling(window=window).mean()
-            moving_averages[f'{window}-day MA'] = ma[-1]  # Get the latest moving average
-        return moving_averages
+        return moving_averages(self.data['Close'], window_sizes)
 
     def get_average_volume(self):
         """Return the average trading volume."""
@@ -31,6 +35,7 @@ class StockAveragesFetcher:
         print(f"Average Volume: {avg_volume:.2f}")
 
 # Example Usage
-ticker = input("Enter a stock ticker (e.g., AAPL, GOOGL): ")
-averages_fetcher = StockAveragesFetcher(ticker)
-averages_fetcher.display_all_averages()
+if __name__ == "__main__":
+    ticker = input("Enter a stock ticker (e.g., AAPL, GOOGL): ")
+    averages_fetcher = StockAveragesFetcher(ticker)
+    averages_fetcher.display_all_averages()
@@ -1,6 +1,20 @@
 import yfinance as yf
 import matplotlib.pyplot as plt
 
+def fibonacci_levels(hist_data):
+    """Return the max/min price and Fibonacci retracement levels for a price history."""
+    # Calculate Fibonacci Retracement Levels based on the max and min price in the period
+    max_price = hist_data['High'].max()
+    min_price = hist_data['Low'].min()
+    diff = max_price - min_price
+    return {
+        'Max Price': max_price,
+        'Min Price': min_price,
+        '0.236': max_price - 0.236 * diff,
+        '0.382': max_price - 0.382 * diff,
+        '0.618': max_price - 0.618 * diff,
+    }
+
 def fetch_and_plot(ticker_symbol):
     try:
         # Fetch historical data
@@ -11,13 +25,12 @@ def fetch_and_plot(ticker_symbol):
         if hist_data.empty:
             raise ValueError("No data found for the given ticker.")
 
-        # Calculate Fibonacci Retracement Levels based on the max and min price in the period
-        max_price = hist_data['High'].max()
-        min_price = hist_data['Low'].min()
-        diff = max_price - min_price
-        level1 = max_price - 0.236 * diff
-        level2 = max_price - 0.382 * diff
-        level3 = max_price - 0.618 * diff
+        levels = fibonacci_levels(hist_data)
+        max_price = levels['Max Price']
+        min_price = levels['Min Price']
+        level1 = levels['0.236']
+        level2 = levels['0.382']
+        level3 = levels['0.618']
 
         # Plot the data along with Fibonacci Levels
         plt.figure(figsize=(12, 8))
@@ -37,7 +50,8 @@ def fetch_and_plot(ticker_symbol):
     except ValueError as ve:
         print(ve)
 
-# User input for ticker symbol
-ticker_symbol = input("Enter the stock ticker for analysis (e.g., AAPL): ")
-fetch_and_plot(ticker_symbol)
+if __name__ == "__main__":
+    # User input for ticker symbol
+    ticker_symbol = input("Enter the stock ticker for analysis (e.g., AAPL): ")
+    fetch_and_plot(ticker_symbol)
 
@@ -0,0 +1,508 @@
+"""This module runs the fetch-and-compute workload across many worker processes.
+
+Tickers are put on a SQLite-backed work queue that any number of worker
+processes on this host claim from. Each worker runs a staged generator
+pipeline (fetch -> normalize -> compute -> persist) and only claims the next
+ticker when the downstream stages are ready for it. Finished tickers are
+checkpointed in the database, so a crashed run resumes where it stopped, and
+every stage reports its throughput.
+
+The queue uses SQLite in WAL mode, which only works when every connection is
+on the same host; do not share the database file over a network filesystem.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import yfinance as yf
+
+from average import moving_averages
+from fibonacci import fibonacci_levels
+from volatility import rolling_volatility
+
+DEFAULT_DB = "pipeline.db"
+STAGES = ["fetch", "normalize", "compute", "persist"]
+LEASE_SECONDS = 60  # A claimed ticker is handed out again if its worker stops heartbeating this long
+HEARTBEAT_SECONDS = 15
+POLL_SECONDS = 5  # How often an idle worker checks for released or retryable tickers
+MAX_ATTEMPTS = 5
+RETRY_SECONDS = 30  # Wait before retrying a failed ticker, doubling with each attempt
+
+INFO_KEYS = ['longName', 'sector', 'industry', 'marketCap', 'trailingPE', 'forwardPE',
+             'priceToBook', 'profitMargins', 'averageVolume']
+STATEMENT_ROWS = ['Total Revenue', 'Net Income', 'Operating Income']
+
+
+def worker_id():
+    """Return the id of the current worker process: <hostname>-<pid>."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def pid_alive(pid):
+    """Return True if a process with the given pid exists on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkQueue:
+    def __init__(self, path=DEFAULT_DB):
+        """Open (and create if needed) the SQLite work queue at the given path."""
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                ticker TEXT PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                retry_after REAL NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                ticker TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                finished_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stage_stats (
+                run_id TEXT NOT NULL,
+                worker TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                items INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                started_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, worker, stage)
+            );
+        """)
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def enqueue(self, tickers):
+        """Add tickers to the queue; tickers already queued or finished are left alone."""
+        self.conn.executemany("INSERT OR IGNORE INTO tasks (ticker) VALUES (?)",
+                              [(t,) for t in tickers])
+
+    def reset_failed(self):
+        """Give every failed ticker a fresh set of attempts; returns how many were reset."""
+        return self.conn.execute(
+            "UPDATE tasks SET status = 'pending', attempts = 0, retry_after = 0, error = NULL "
+            "WHERE status = 'failed'").rowcount
+
+    def start_run(self):
+        """Register a new run and return its id; throughput is reported per run."""
+        run_id = uuid.uuid4().hex
+        self.conn.execute("INSERT INTO runs (run_id, started_at) VALUES (?, ?)", (run_id, time.time()))
+        return run_id
+
+    def latest_run(self):
+        """Return the id of the most recently started run, or None."""
+        row = self.conn.execute("SELECT run_id FROM runs ORDER BY started_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def claim(self, worker):
+        """Atomically claim the next available ticker for a worker, or return None."""
+        now = time.time()
+        stale_before = now - LEASE_SECONDS
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Tickers whose lease expired on their last allowed attempt are given up on
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'Lease expired' "
+                "WHERE status = 'claimed' AND claimed_at < ? AND attempts >= ?",
+                (stale_before, MAX_ATTEMPTS))
+            row = self.conn.execute(
+                "SELECT ticker FROM tasks "
+                "WHERE ((status = 'pending' AND retry_after <= ?) OR (status = 'claimed' AND claimed_at < ?)) "
+                "AND attempts < ? ORDER BY rowid LIMIT 1",
+                (now, stale_before, MAX_ATTEMPTS)).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE tasks SET status = 'claimed', worker = ?, claimed_at = ?, "
+                "attempts = attempts + 1 WHERE ticker = ?",
+                (worker, now, row[0]))
+            self.conn.execute("COMMIT")
+            return row[0]
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def renew(self, worker):
+        """Extend the lease on every ticker the worker currently holds."""
+        self.conn.execute("UPDATE tasks SET claimed_at = ? WHERE worker = ? AND status = 'claimed'",
+                          (time.time(), worker))
+
+    def outstanding(self):
+        """Return the number of tickers not yet done or failed, including those waiting to be retried."""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'claimed')").fetchone()[0]
+
+    def release_dead_workers(self):
+        """Put tickers held by workers on this host whose process has died back to pending."""
+        host = socket.gethostname()
+        rows = self.conn.execute("SELECT ticker, worker FROM tasks WHERE status = 'claimed'").fetchall()
+        released = 0
+        for ticker, worker in rows:
+            worker_host, _, pid = (worker or "").rpartition("-")
+            if worker_host != host or not pid.isdigit() or pid_alive(int(pid)):
+                continue
+            released += self.conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL WHERE ticker = ? AND worker = ? AND status = 'claimed'",
+                (MAX_ATTEMPTS, ticker, worker)).rowcount
+        return released
+
+    def complete(self, ticker, worker, data):
+        """Store a ticker's results and mark it done in one transaction (the checkpoint).
+
+        Returns False, writing nothing, if the worker no longer holds the ticker's lease.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = self.conn.execute(
+                "UPDATE tasks SET status = 'done', error = NULL "
+                "WHERE ticker = ? AND worker = ? AND status = 'claimed'", (ticker, worker)).rowcount
+            if not updated:
+                self.conn.execute("ROLLBACK")
+                return False
+            self.conn.execute("INSERT OR REPLACE INTO results (ticker, data, finished_at) VALUES (?, ?, ?)",
+                              (ticker, json.dumps(data), time.time()))
+            self.conn.execute("COMMIT")
+            return True
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def fail(self, ticker, worker, error):
+        """Release a ticker after an error; it is retried until MAX_ATTEMPTS is reached.
+
+        Each retry waits RETRY_SECONDS, doubled for every attempt so far, so a
+        burst of rate limiting or a network drop does not use up the attempts.
+        Does nothing if the worker no longer holds the ticker's lease.
+        """
+        return self.conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "retry_after = ? * (1 << (attempts - 1)) + ?, "
+            "error = ? WHERE ticker = ? AND worker = ? AND status = 'claimed'",
+            (MAX_ATTEMPTS, RETRY_SECONDS, time.time(), str(error), ticker, worker)).rowcount > 0
+
+    def record_stage(self, run_id, worker, stage, items, seconds, started_at):
+        """Save the running throughput counters for one stage of one worker in a run."""
+        self.conn.execute("INSERT OR REPLACE INTO stage_stats "
+                          "(run_id, worker, stage, items, seconds, started_at, updated_at) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (run_id, worker, stage, items, seconds, started_at, time.time()))
+
+    def counts(self):
+        """Return the number of tickers in each status."""
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"))
+
+    def stage_throughput(self, run_id):
+        """Return {stage: (items, busy_seconds, wall_seconds)} across all workers of a run.
+
+        busy_seconds is the time workers spent inside the stage, summed;
+        wall_seconds runs from the first worker starting the stage to the latest update.
+        """
+        rows = self.conn.execute("SELECT stage, SUM(items), SUM(seconds), MIN(started_at), MAX(updated_at) "
+                                 "FROM stage_stats WHERE run_id = ? GROUP BY stage", (run_id,))
+        return {stage: (items, seconds, updated - started) for stage, items, seconds, started, updated in rows}
+
+    def results(self):
+        """Return {ticker: data} for every finished ticker."""
+        return {ticker: json.loads(data) for ticker, data in self.conn.execute("SELECT ticker, data FROM results")}
+
+
+# --- Helpers ---
+
+def clean_float(value):
+    """Return value as a float, or None if it is missing or not a number."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+class StageTimer:
+    def __init__(self, queue, run_id, worker, stage, report_every=10):
+        """Count items and time spent in one stage, saving the totals periodically."""
+        self.queue = queue
+        self.run_id = run_id
+        self.worker = worker
+        self.stage = stage
+        self.report_every = report_every
+        self.items = 0
+        self.seconds = 0.0
+        self.started_at = None
+
+    def measure(self, func, item):
+        """Return func(item), adding the time it took to this stage."""
+        if self.started_at is None:
+            self.started_at = time.time()
+        start = time.perf_counter()
+        try:
+            return func(item)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def count(self):
+        """Count one item through the stage, saving the totals every report_every items."""
+        self.items += 1
+        if self.items % self.report_every == 0:
+            self.flush()
+
+    def wrap(self, upstream, func):
+        """Yield func(item) for each upstream item, timing only this stage's own work."""
+        for item in upstream:
+            result = self.measure(func, item)
+            if result is None:
+                continue
+            self.count()
+            yield result
+        self.flush()
+
+    def flush(self):
+        """Write the current counters to the queue database."""
+        if self.started_at is not None:
+            self.queue.record_stage(self.run_id, self.worker, self.stage, self.items, self.seconds, self.started_at)
+
+
+class Heartbeat:
+    def __init__(self, db_path, worker):
+        """Renew a worker's leases from a background thread while it is busy."""
+        self.db_path = db_path
+        self.worker = worker
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="Heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        # SQLite connections cannot be shared between threads, so open our own
+        queue = WorkQueue(self.db_path)
+        try:
+            while not self._stop.wait(HEARTBEAT_SECONDS):
+                queue.renew(self.worker)
+        finally:
+            queue.close()
+
+
+# --- Stages ---
+
+def fetch(ticker):
+    """Download price history, company info and financials for a ticker."""
+    stock = yf.Ticker(ticker)
+    return {
+        'ticker': ticker,
+        'history': stock.history(period="1y"),
+        'info': stock.info,
+        'financials': stock.financials,
+    }
+
+
+def claimed_tickers(queue, worker, fetch_timer):
+    """Fetch stage: claim tickers one at a time and download their data.
+
+    Being a generator, the next ticker is only claimed once the downstream
+    stages have consumed the previous one, which keeps each worker from
+    taking on more than it can process. While tickers are still held by
+    other workers or waiting to be retried, an idle worker keeps polling so
+    it can pick them up once they become available.
+    """
+    while True:
+        ticker = queue.claim(worker)
+        if ticker is None:
+            if not queue.outstanding():
+                break
+            time.sleep(POLL_SECONDS)
+            continue
+        try:
+            raw = fetch_timer.measure(fetch, ticker)
+        except Exception as e:
+            queue.fail(ticker, worker, e)
+            print(f"[{worker}] Error fetching {ticker}: {e}")
+            continue
+        fetch_timer.count()
+        yield raw
+    fetch_timer.flush()
+
+
+def normalize(raw):
+    """Normalize stage: drop unusable rows and reduce info/financials to plain floats."""
+    history = raw['history']
+    if history is None or history.empty:
+        raise ValueError("No data found for the given ticker.")
+    history = history.dropna(subset=['Close'])
+
+    info = raw['info'] or {}
+    info = {key: info.get(key) if key in ('longName', 'sector', 'industry') else clean_float(info.get(key))
+            for key in INFO_KEYS}
+
+    statements = {}
+    financials = raw['financials']
+    if financials is not None and not financials.empty:
+        latest = financials.iloc[:, 0]
+        statements = {row: clean_float(latest.get(row)) for row in STATEMENT_ROWS}
+
+    return {'ticker': raw['ticker'], 'history': history, 'info': info, 'statements': statements}
+
+
+def compute(record):
+    """Compute stage: moving averages, volatility and Fibonacci retracement levels."""
+    history = record['history']
+    close = history['Close']
+
+    averages = {key: clean_float(value) for key, value in moving_averages(close).items()}
+    averages['Average Volume'] = clean_float(history['Volume'].mean())
+
+    return {
+        'ticker': record['ticker'],
+        'last_date': str(history.index[-1].date()),
+        'info': record['info'],
+        'statements': record['statements'],
+        'averages': averages,
+        'volatility': clean_float(rolling_volatility(close).iloc[-1]),
+        'fibonacci': {key: clean_float(value) for key, value in fibonacci_levels(history).items()},
+    }
+
+
+# --- Workers ---
+
+def run_worker(db_path, run_id=None, worker=None):
+    """Run one worker on this host until no tickers are left to claim.
+
+    Throughput is recorded under run_id, which defaults to the latest run.
+    """
+    worker = worker or worker_id()
+    queue = WorkQueue(db_path)
+    run_id = run_id or queue.latest_run() or queue.start_run()
+    timers = {stage: StageTimer(queue, run_id, worker, stage) for stage in STAGES}
+
+    def guarded(func):
+        """Run a stage function, failing the ticker instead of the whole worker on errors."""
+        def run(item):
+            try:
+                return func(item)
+            except Exception as e:
+                queue.fail(item['ticker'], worker, e)
+                print(f"[{worker}] Error processing {item['ticker']}: {e}")
+                return None
+        return run
+
+    def persist(result):
+        """Persist stage: store the results and checkpoint the ticker as done."""
+        if not queue.complete(result['ticker'], worker, result):
+            print(f"[{worker}] Lost the lease on {result['ticker']}; discarding its results.")
+            return None
+        return result['ticker']
+
+    fetched = claimed_tickers(queue, worker, timers['fetch'])
+    normalized = timers['normalize'].wrap(fetched, guarded(normalize))
+    computed = timers['compute'].wrap(normalized, guarded(compute))
+    persisted = timers['persist'].wrap(computed, guarded(persist))
+
+    with Heartbeat(db_path, worker):
+        done = sum(1 for _ in persisted)
+    queue.close()
+    print(f"[{worker}] Finished {done} tickers.")
+    return done
+
+
+def report(queue, run_id=None):
+    """Print queue progress and per-stage throughput for a run (the latest by default)."""
+    counts = queue.counts()
+    total = sum(counts.values())
+    print(f"--- Progress: {counts.get('done', 0)}/{total} done, "
+          f"{counts.get('claimed', 0)} in progress, {counts.get('failed', 0)} failed ---")
+    throughput = queue.stage_throughput(run_id or queue.latest_run())
+    for stage in STAGES:
+        items, busy, wall = throughput.get(stage, (0, 0.0, 0.0))
+        rate = items / wall if wall else 0.0
+        per_item = busy / items if items else 0.0
+        print(f"{stage.title()}: {items} items in {wall:.1f}s "
+              f"({rate:.2f} items/s overall, {per_item:.2f}s per item per worker)")
+
+
+def run_pipeline(tickers, db_path=DEFAULT_DB, workers=4, report_interval=10, retry_failed=True):
+    """Queue tickers and process them with local worker processes, reporting as they go.
+
+    Re-running with the same db_path resumes: finished tickers are skipped,
+    tickers held by crashed workers on this host are released straight away
+    and, unless retry_failed is False, failed tickers are tried again.
+    """
+    queue = WorkQueue(db_path)
+    queue.enqueue(tickers)
+    released = queue.release_dead_workers()
+    if released:
+        print(f"Released {released} tickers held by crashed workers.")
+    if retry_failed:
+        reset = queue.reset_failed()
+        if reset:
+            print(f"Retrying {reset} previously failed tickers.")
+    run_id = queue.start_run()
+
+    processes = [multiprocessing.Process(target=run_worker, args=(db_path, run_id)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    while any(process.is_alive() for process in processes):
+        report(queue, run_id)
+        for process in processes:
+            process.join(timeout=report_interval / len(processes))
+
+    report(queue, run_id)
+    results = queue.results()
+    queue.close()
+    return results
+
+
+# Example Usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded fetch-and-compute pipeline.")
+    parser.add_argument("mode", choices=["run", "worker", "status"],
+                        help="run: queue tickers and start local workers; "
+                             "worker: join an existing queue from another process on this host; "
+                             "status: print progress")
+    parser.add_argument("tickers", nargs="*", help="Tickers to queue (run mode)")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Path to the SQLite queue (local disk only)")
+    parser.add_argument("--workers", type=int, default=4, help="Number of local worker processes")
+    parser.add_argument("--skip-failed", action="store_true",
+                        help="Do not retry tickers that failed in a previous run")
+    args = parser.parse_args()
+
+    if args.mode == "run":
+        tickers = args.tickers or [t.strip().upper() for t in
+                                   input("Enter stock tickers separated by commas: ").split(",") if t.strip()]
+        results = run_pipeline(tickers, db_path=args.db, workers=args.workers,
+                               retry_failed=not args.skip_failed)
+        print(f"Stored results for {len(results)} tickers in {args.db}")
+    elif args.mode == "worker":
+        run_worker(args.db)
+    else:
+        report(WorkQueue(args.db))
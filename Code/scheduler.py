@@ -0,0 +1,550 @@
+"""This module schedules incremental, market-calendar-aware refreshes of stock data.
+
+Instead of refetching everything on every run, the scheduler tracks when each
+ticker was last fetched and only queues the fetches that are actually stale:
+prices and fundamentals once per new trading session (after the close has
+settled), and financial statements quarterly. Index tickers only have prices.
+It runs as a background daemon with a bounded number of concurrent fetches and
+exposes its queue depth and lag.
+"""
+import heapq
+import json
+import os
+import pickle
+import threading
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import yfinance as yf
+
+from stock_ex_comparison import exchanges_list
+
+# --- Holiday rules ---
+
+def easter_sunday(year):
+    """Return the date of Easter Sunday (Gregorian calendar) for a year."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """Return the nth given weekday (Monday=0) of a month; n=-1 is the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def us_observed(day):
+    """Move a US holiday on a Saturday to the Friday before and a Sunday to the Monday after."""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def uk_substitute(days):
+    """Move UK bank holidays falling on a weekend to the next free weekday."""
+    taken = set()
+    for day in days:
+        while day.weekday() >= 5 or day in taken:
+            day += timedelta(days=1)
+        taken.add(day)
+    return taken
+
+
+def us_holidays(year):
+    """Return the NYSE/NASDAQ full-day closures for a year."""
+    easter = easter_sunday(year)
+    holidays = {
+        nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        us_observed(date(year, 7, 4)),  # Independence Day
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving Day
+        us_observed(date(year, 12, 25)),  # Christmas Day
+    }
+    # New Year's Day on a Saturday is not observed on the Friday before
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(us_observed(new_year))
+    if year >= 2022:
+        holidays.add(us_observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def us_early_closes(year):
+    """Return the NYSE/NASDAQ 1 p.m. early closes for a year."""
+    candidates = [
+        date(year, 7, 3),  # Day before Independence Day
+        nth_weekday(year, 11, 3, 4) + timedelta(days=1),  # Day after Thanksgiving
+        date(year, 12, 24),  # Christmas Eve
+    ]
+    holidays = us_holidays(year)
+    return {day: time(13, 0) for day in candidates if day.weekday() < 5 and day not in holidays}
+
+
+def uk_holidays(year):
+    """Return the London Stock Exchange full-day closures (England bank holidays) for a year."""
+    easter = easter_sunday(year)
+    holidays = {
+        easter - timedelta(days=2),  # Good Friday
+        easter + timedelta(days=1),  # Easter Monday
+        nth_weekday(year, 5, 0, 1),  # Early May bank holiday
+        nth_weekday(year, 5, 0, -1),  # Spring bank holiday
+        nth_weekday(year, 8, 0, -1),  # Summer bank holiday
+    }
+    holidays |= uk_substitute([date(year, 1, 1)])  # New Year's Day
+    holidays |= uk_substitute([date(year, 12, 25), date(year, 12, 26)])  # Christmas and Boxing Day
+    return holidays
+
+
+def uk_early_closes(year):
+    """Return the London Stock Exchange 12:30 early closes for a year."""
+    candidates = [date(year, 12, 24), date(year, 12, 31)]
+    holidays = uk_holidays(year)
+    return {day: time(12, 30) for day in candidates if day.weekday() < 5 and day not in holidays}
+
+
+# Trading hours and holiday rules for each exchange
+MARKET_CALENDARS = {
+    "XNYS": {"tz": "America/New_York", "open": time(9, 30), "close": time(16, 0),
+             "holidays": us_holidays, "early_closes": us_early_closes},
+    "XNAS": {"tz": "America/New_York", "open": time(9, 30), "close": time(16, 0),
+             "holidays": us_holidays, "early_closes": us_early_closes},
+    "XLON": {"tz": "Europe/London", "open": time(8, 0), "close": time(16, 30),
+             "holidays": uk_holidays, "early_closes": uk_early_closes},
+}
+
+# Exchange each index in stock_ex_comparison.exchanges_list trades on
+INDEX_EXCHANGES = {
+    "^GSPC": "XNYS",
+    "^IXIC": "XNAS",
+    "^DJI": "XNYS",
+    "^FTSE": "XLON",
+}
+
+# Exchange for Yahoo Finance ticker suffixes (e.g. VOD.L)
+SUFFIX_EXCHANGES = {
+    ".L": "XLON",
+}
+
+# Tickers without a suffix are treated as US equities
+DEFAULT_EXCHANGE = "XNYS"
+
+# Fetch kinds in priority order (lower runs first)
+FETCH_PRIORITIES = {"prices": 0, "fundamentals": 1, "statements": 2}
+STATEMENTS_INTERVAL = timedelta(days=91)
+
+# How long after a session close before its daily bar is treated as final
+SETTLE_DELAY = timedelta(minutes=30)
+
+# Failed fetches are retried after RETRY_DELAY, doubling per failure up to MAX_RETRY_DELAY
+RETRY_DELAY = timedelta(minutes=2)
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+
+class MarketCalendar:
+    def __init__(self, code, extra_holidays=()):
+        """Initialize the calendar for an exchange code from MARKET_CALENDARS."""
+        spec = MARKET_CALENDARS[code]
+        self.code = code
+        self.tz = ZoneInfo(spec["tz"])
+        self.open_time = spec["open"]
+        self.close_time = spec["close"]
+        self.holiday_rule = spec["holidays"]
+        self.early_close_rule = spec["early_closes"]
+        self.extra_holidays = set(extra_holidays)
+        self._years = {}
+
+    def _year(self, year):
+        """Return the (holidays, early closes) for a year, computing them once."""
+        if year not in self._years:
+            self._years[year] = (self.holiday_rule(year), self.early_close_rule(year))
+        return self._years[year]
+
+    def is_trading_day(self, day):
+        """Return True if the exchange has a session on the given date."""
+        if day.weekday() >= 5:
+            return False
+        if day in self.extra_holidays:
+            return False
+        return day not in self._year(day.year)[0]
+
+    def session_close(self, day):
+        """Return the timezone-aware closing time of the session on the given date."""
+        close_time = self._year(day.year)[1].get(day, self.close_time)
+        return datetime.combine(day, close_time, tzinfo=self.tz)
+
+    def is_open(self, now):
+        """Return True if the exchange is trading at the given moment."""
+        day = now.astimezone(self.tz).date()
+        if not self.is_trading_day(day):
+            return False
+        return datetime.combine(day, self.open_time, tzinfo=self.tz) <= now < self.session_close(day)
+
+    def last_close(self, now):
+        """Return the most recent session close at or before the given moment."""
+        day = now.astimezone(self.tz).date()
+        for _ in range(14):
+            if self.is_trading_day(day):
+                close = self.session_close(day)
+                if close <= now:
+                    return close
+            day -= timedelta(days=1)
+        raise ValueError(f"No trading session found for {self.code} in the last two weeks.")
+
+
+def exchange_for(ticker):
+    """Return the exchange code a ticker trades on, or raise ValueError if it is unknown."""
+    if ticker in INDEX_EXCHANGES:
+        return INDEX_EXCHANGES[ticker]
+    if ticker.startswith("^"):
+        raise ValueError(f"No exchange calendar for index {ticker}.")
+    if "." in ticker:
+        suffix = "." + ticker.rsplit(".", 1)[1]
+        if suffix not in SUFFIX_EXCHANGES:
+            raise ValueError(f"No exchange calendar for ticker suffix {suffix} ({ticker}).")
+        return SUFFIX_EXCHANGES[suffix]
+    return DEFAULT_EXCHANGE
+
+
+def kinds_for(ticker):
+    """Return the fetch kinds that apply to a ticker; indices only have prices."""
+    if ticker.startswith("^"):
+        return ["prices"]
+    return list(FETCH_PRIORITIES)
+
+
+def fetch_prices(ticker, since=None):
+    """Fetch daily prices, only from the last fetch onwards when one exists."""
+    if since is None:
+        return yf.download(ticker, period="1y", progress=False)
+    return yf.download(ticker, start=since.date().isoformat(), progress=False)
+
+
+def fetch_fundamentals(ticker, since=None):
+    """Fetch the company info snapshot for a ticker."""
+    return yf.Ticker(ticker).info
+
+
+def fetch_statements(ticker, since=None):
+    """Fetch the income statement, balance sheet and cash flow for a ticker."""
+    company = yf.Ticker(ticker)
+    return {
+        "Income Statement": company.financials,
+        "Balance Sheet": company.balance_sheet,
+        "Cash Flow": company.cashflow,
+    }
+
+
+FETCHERS = {
+    "prices": fetch_prices,
+    "fundamentals": fetch_fundamentals,
+    "statements": fetch_statements,
+}
+
+
+class RefreshScheduler:
+    def __init__(self, tickers, state_path=None, max_workers=4, poll_interval=60,
+                 on_result=None, holidays=None, data_dir=None):
+        """Initialize the scheduler for a list of tickers.
+
+        state_path is an optional JSON file used to persist per-ticker freshness
+        between runs. on_result is called as on_result(ticker, kind, data) after
+        each successful fetch; price fetches are incremental, so a custom handler
+        only receives the rows since the last fetch. By default the results are
+        kept in self.results, with new prices merged into the stored ones, and
+        saved to data_dir (next to state_path unless given). holidays maps an
+        exchange code to extra closure dates, e.g. {"XNYS": [date(2025, 1, 9)]}.
+        """
+        holidays = holidays or {}
+        unknown = set(holidays) - set(MARKET_CALENDARS)
+        if unknown:
+            raise ValueError(f"Unknown exchange codes in holidays: {', '.join(sorted(unknown))}")
+
+        self.tickers = list(tickers)
+        self.exchanges = {ticker: exchange_for(ticker) for ticker in self.tickers}
+        self.state_path = state_path
+        if data_dir is None and state_path:
+            data_dir = os.path.splitext(state_path)[0] + "_data"
+        self.data_dir = data_dir
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.on_result = on_result or self._store_result
+        self.calendars = {code: MarketCalendar(code, holidays.get(code, ()))
+                          for code in MARKET_CALENDARS}
+        self.results = self._load_results()
+
+        self._freshness = self._load_state()
+        self._queue = []
+        self._queued = set()
+        self._in_flight = set()
+        self._lag = {}
+        self._failures = {}
+        self._state_dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    # --- Freshness tracking ---
+
+    def _load_state(self):
+        """Load last-fetched timestamps from state_path, if it exists."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            raw = json.load(f)
+        return {ticker: {kind: datetime.fromisoformat(ts) for kind, ts in kinds.items()}
+                for ticker, kinds in raw.items()}
+
+    def _save_state(self):
+        """Write last-fetched timestamps to state_path atomically, if they changed.
+
+        Only the snapshot is taken under the lock; the file is written outside it
+        so dispatch and monitoring are not blocked.
+        """
+        if not self.state_path:
+            return
+        with self._lock:
+            if not self._state_dirty:
+                return
+            snapshot = {ticker: dict(kinds) for ticker, kinds in self._freshness.items()}
+            self._state_dirty = False
+        raw = {ticker: {kind: ts.isoformat() for kind, ts in kinds.items()}
+               for ticker, kinds in snapshot.items()}
+        tmp_path = self.state_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(raw, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"Error saving refresh state to {self.state_path}: {e}")
+            with self._lock:
+                self._state_dirty = True
+
+    def last_fetched(self, ticker, kind):
+        """Return when a ticker's data of the given kind was last fetched, or None."""
+        return self._freshness.get(ticker, {}).get(kind)
+
+    def _due_since(self, ticker, kind, now):
+        """Return the moment a fetch became due, or None if the data is still fresh.
+
+        Prices and fundamentals are due once per session, after its close has
+        settled; statements are due quarterly, checked at the same point.
+        """
+        last = self.last_fetched(ticker, kind)
+        settled = self.calendars[self.exchanges[ticker]].last_close(now - SETTLE_DELAY) + SETTLE_DELAY
+        if last is None:
+            return settled
+        if kind == "statements":
+            due = last + STATEMENTS_INTERVAL
+            return due if due <= settled else None
+        return settled if last < settled else None
+
+    def _stale(self, now):
+        """Return every stale (ticker, kind, lag), including fetches backing off after a failure."""
+        stale = []
+        for ticker in self.tickers:
+            for kind in kinds_for(ticker):
+                since = self._due_since(ticker, kind, now)
+                if since is not None:
+                    stale.append((ticker, kind, max(now - since, timedelta(0))))
+        # Higher priority kinds first, then the most overdue
+        stale.sort(key=lambda item: (FETCH_PRIORITIES[item[1]], -item[2]))
+        return stale
+
+    def _backing_off(self, key, now):
+        """Return True if a failed fetch should not be retried yet."""
+        failure = self._failures.get(key)
+        return failure is not None and failure[1] > now
+
+    def due_fetches(self, now=None):
+        """Return the stale (ticker, kind, lag) fetches that can run now, highest priority first."""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            return [item for item in self._stale(now) if not self._backing_off(item[:2], now)]
+
+    # --- Queue and dispatch ---
+
+    def refresh_queue(self, now=None):
+        """Queue every stale fetch that is not already queued, in flight or backing off."""
+        now = now or datetime.now(timezone.utc)
+        stale = self._stale(now)
+        with self._lock:
+            self._lag = {(ticker, kind): lag for ticker, kind, lag in stale}
+            due = 0
+            for ticker, kind, lag in stale:
+                key = (ticker, kind)
+                if self._backing_off(key, now):
+                    continue
+                due += 1
+                if key in self._queued or key in self._in_flight:
+                    continue
+                heapq.heappush(self._queue, (FETCH_PRIORITIES[kind], -lag.total_seconds(), ticker, kind))
+                self._queued.add(key)
+        return due
+
+    def _dispatch(self):
+        """Submit queued fetches until max_workers are in flight."""
+        with self._lock:
+            while self._queue and len(self._in_flight) < self.max_workers and not self._stop.is_set():
+                _, _, ticker, kind = heapq.heappop(self._queue)
+                key = (ticker, kind)
+                self._queued.discard(key)
+                self._in_flight.add(key)
+                self._executor.submit(self._run_fetch, ticker, kind)
+
+    def _run_fetch(self, ticker, kind):
+        """Run a single fetch, record its freshness and hand the result on."""
+        key = (ticker, kind)
+        started = datetime.now(timezone.utc)
+        try:
+            data = FETCHERS[kind](ticker, self.last_fetched(ticker, kind))
+            self.on_result(ticker, kind, data)
+            with self._lock:
+                self._freshness.setdefault(ticker, {})[kind] = started
+                self._state_dirty = True
+                self._lag.pop(key, None)
+                self._failures.pop(key, None)
+        except Exception as e:
+            # Leave the data stale and back off before retrying
+            with self._lock:
+                failures = self._failures.get(key, (0, None))[0] + 1
+                delay = min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY)
+                self._failures[key] = (failures, datetime.now(timezone.utc) + delay)
+            print(f"Error fetching {kind} for {ticker} (failure {failures}, retrying in {delay}): {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+            self._dispatch()
+
+    def _store_result(self, ticker, kind, data):
+        """Default result handler: merge new prices into the stored ones and save the data."""
+        if kind == "prices":
+            stored = self.results.get(ticker, {}).get("prices")
+            if stored is not None and not stored.empty:
+                data = pd.concat([stored, data])
+                data = data[~data.index.duplicated(keep="last")].sort_index()
+        self.results.setdefault(ticker, {})[kind] = data
+        if self.data_dir:
+            os.makedirs(self.data_dir, exist_ok=True)
+            path = os.path.join(self.data_dir, f"{ticker}.{kind}.pkl")
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(data, f)
+            os.replace(path + ".tmp", path)
+
+    def _load_results(self):
+        """Load the data saved by _store_result in previous runs."""
+        results = {}
+        if not self.data_dir or not os.path.isdir(self.data_dir):
+            return results
+        for name in os.listdir(self.data_dir):
+            if not name.endswith(".pkl"):
+                continue
+            ticker, kind, _ = name.rsplit(".", 2)
+            with open(os.path.join(self.data_dir, name), "rb") as f:
+                results.setdefault(ticker, {})[kind] = pickle.load(f)
+        return results
+
+    # --- Daemon lifecycle ---
+
+    def start(self):
+        """Start the scheduler as a background daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._thread = threading.Thread(target=self._loop, name="RefreshScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Stop polling, drop queued fetches and optionally wait for in-flight ones."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        with self._lock:
+            self._queue.clear()
+            self._queued.clear()
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+        self._save_state()
+
+    def _loop(self):
+        """Poll for stale data until stopped."""
+        while not self._stop.is_set():
+            self.refresh_queue()
+            self._dispatch()
+            self._save_state()
+            self._stop.wait(self.poll_interval)
+
+    # --- Monitoring ---
+
+    def queue_depth(self):
+        """Return the number of fetches waiting to run."""
+        with self._lock:
+            return len(self._queue)
+
+    def in_flight(self):
+        """Return the number of fetches currently running."""
+        with self._lock:
+            return len(self._in_flight)
+
+    def lag(self):
+        """Return how overdue each stale (ticker, kind) was at the last poll."""
+        with self._lock:
+            return dict(self._lag)
+
+    def backing_off(self):
+        """Return the number of failed fetches waiting to be retried."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            return sum(1 for key in self._failures if self._backing_off(key, now))
+
+    def open_exchanges(self):
+        """Return the codes of the exchanges used by the tickers that are trading right now."""
+        now = datetime.now(timezone.utc)
+        return sorted(code for code in set(self.exchanges.values()) if self.calendars[code].is_open(now))
+
+    def max_lag(self):
+        """Return the largest lag across all stale data, or zero if everything is fresh."""
+        lags = self.lag()
+        return max(lags.values()) if lags else timedelta(0)
+
+    def status(self):
+        """Return a one-line summary of the scheduler state."""
+        return (f"Queue Depth: {self.queue_depth()} | In Flight: {self.in_flight()} | "
+                f"Stale: {len(self.lag())} | Backing Off: {self.backing_off()} | "
+                f"Max Lag: {self.max_lag()} | Open: {', '.join(self.open_exchanges()) or 'none'}")
+
+
+# Example Usage
+if __name__ == "__main__":
+    user_input = input("Enter stock tickers separated by commas (e.g., AAPL, MSFT, VOD.L): ")
+    tickers = list(exchanges_list) + [t.strip().upper() for t in user_input.split(",") if t.strip()]
+
+    scheduler = RefreshScheduler(tickers, state_path="refresh_state.json")
+    scheduler.start()
+    try:
+        while True:
+            print(scheduler.status())
+            _time.sleep(10)
+    except KeyboardInterrupt:
+        scheduler.stop()
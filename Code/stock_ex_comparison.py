@@ -12,27 +12,28 @@ exchanges_list = {
     # Add more exchanges or indices if needed
 }
 
-# User selects 4 exchanges for comparison
-selected_exchanges = ["^GSPC", "^IXIC", "^DJI", "^FTSE"]
+if __name__ == "__main__":
+    # User selects 4 exchanges for comparison
+    selected_exchanges = ["^GSPC", "^IXIC", "^DJI", "^FTSE"]
 
-# Define the time period for analysis
-start_date = '2000-01-01'
-end_date = '2023-11-01'
+    # Define the time period for analysis
+    start_date = '2000-01-01'
+    end_date = '2023-11-01'
 
-# Create an empty DataFrame to store the normalized closing prices
-normalized_closing_prices = pd.DataFrame()
+    # Create an empty DataFrame to store the normalized closing prices
+    normalized_closing_prices = pd.DataFrame()
 
-# Fetch the closing prices for each exchange
-for exchange in selected_exchanges:
-    data = yf.download(exchange, start=start_date, end=end_date, progress=False)
-    # Normalize the closing prices to compare the performance starting from the same point
-    normalized_closing_prices[exchanges_list[exchange]] = data['Close'] / data['Close'].iloc[0]
+    # Fetch the closing prices for each exchange
+    for exchange in selected_exchanges:
+        data = yf.download(exchange, start=start_date, end=end_date, progress=False)
+        # Normalize the closing prices to compare the performance starting from the same point
+        normalized_closing_prices[exchanges_list[exchange]] = data['Close'] / data['Close'].iloc[0]
 
-# Plot the normalized closing prices for comparison
-normalized_closing_prices.plot(figsize=(14, 7))
-plt.title('Comparative Analysis of Stock Exchange Performance')
-plt.xlabel('Date')
-plt.ylabel('Normalized Closing Price')
-plt.legend(title='Exchange')
-plt.grid(True)
-plt.show()
+    # Plot the normalized closing prices for comparison
+    normalized_closing_prices.plot(figsize=(14, 7))
+    plt.title('Comparative Analysis of Stock Exchange Performance')
+    plt.xlabel('Date')
+    plt.ylabel('Normalized Closing Price')
+    plt.legend(title='Exchange')
+    plt.grid(True)
+    plt.show()